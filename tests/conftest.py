@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Keep the warm table the app builds on import out of the working tree
+os.environ.setdefault("VIPV_WARM_TABLE", os.path.join(tempfile.mkdtemp(), "warm_results.json.gz"))
@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pyarrow.dataset as ds
+import pytest
+
+import vipv_tool as vipv
+
+
+def run_export(directory, samples, fmt='parquet'):
+    batches = vipv.sweep_batches(vipv.cities[:3], list(vipv.segments)[:2], ['Open Lot'], samples, chunk_size=1000)
+    return vipv.export_sweep(batches, str(directory), fmt)
+
+
+def test_grid_sweep_matches_calculate_results():
+    tables = vipv.sweep_tables()
+    batch = next(vipv.sweep_batches(vipv.cities, list(vipv.segments), list(vipv.parking_contexts), 1))
+    scenarios, monthly = vipv.evaluate_batch(batch, tables)
+    for i in range(0, len(batch['scenario_id']), 37):
+        scenario = vipv.default_scenario(vipv.cities[batch['region'][i]], tables['segment_names'][batch['segment'][i]])
+        scenario['parking_context'] = tables['context_names'][batch['parking_context'][i]]
+        results = vipv.calculate_results(scenario)
+        assert np.isclose(results['annual_energy_kwh'], scenarios['annual_energy_kwh'][i])
+        assert np.isclose(results['payback_period'], scenarios['payback_years'][i])
+        assert np.allclose(results['monthly_energy'], monthly['energy_kwh_day'][i * 12:(i + 1) * 12])
+
+
+@pytest.mark.parametrize("fmt", ['parquet', 'arrow'])
+def test_export_writes_one_file_per_partition(tmp_path, fmt):
+    scenario_summary, _ = run_export(tmp_path, 2000, fmt)
+    for name in ('scenarios', 'monthly'):
+        for city in vipv.cities[:3]:
+            assert len(os.listdir(tmp_path / name / f"region={city}")) == 1
+    dataset = ds.dataset(tmp_path / 'monthly', format='parquet' if fmt == 'parquet' else 'ipc', partitioning='hive')
+    assert dataset.count_rows() == 3 * 2 * 2000 * 12
+    assert scenario_summary['Scenarios'].sum() == 3 * 2 * 2000
+
+
+def test_export_refuses_directories_it_did_not_create(tmp_path):
+    (tmp_path / 'scenarios').mkdir()
+    (tmp_path / 'scenarios' / 'keep.txt').write_text('data')
+    with pytest.raises(ValueError):
+        run_export(tmp_path, 1)
+    assert (tmp_path / 'scenarios' / 'keep.txt').exists()
+
+    run_export(tmp_path / 'exports', 1)
+    run_export(tmp_path / 'exports', 1)  # Re-running over its own output is allowed
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import vipv_tool as vipv
+
+
+def test_fetch_forecast_returns_at_provider_timeout():
+    provider = vipv.StubProvider(latency=3, timeout=0.5)
+    start = time.monotonic()
+    assert vipv.fetch_forecast(provider, 'Dubai') is None
+    assert time.monotonic() - start < 1.0
+
+
+def test_tutiempo_keeps_day_positions_for_incomplete_rows():
+    row = "<tr>" + "<td>x</td>" * 4 + "<td>{}</td></tr>"
+    html = ("<table class='medias'><tr><th>header</th></tr>" + row.format("5.1") +
+            "<tr><td>short</td></tr>" + row.format("6.2") + "</table>")
+    forecast = vipv.TutiempoProvider.parse(html)
+    assert list(forecast) == ["Today", "Day +1", "Day +2"]
+    assert forecast["Day +1"]['radiation'] is None
+    assert forecast["Day +2"]['radiation'] == 6.2
+
+
+def test_stub_provider_is_reproducible_under_concurrency():
+    provider = vipv.StubProvider(seed=7, max_concurrency=8)
+    cities = vipv.cities * 4
+    results = asyncio.run(vipv.fetch_forecasts(provider, cities))
+    for city in vipv.cities:
+        expected = provider.fetch_sync(city)
+        assert results[city] == expected
+
+
+class CountingProvider(vipv.StubProvider):
+    """Stub that records the peak number of fetches in flight"""
+
+    def __init__(self, **kwargs):
+        super().__init__(latency=0.05, **kwargs)
+        self.lock = threading.Lock()
+        self.active = self.peak = 0
+
+    def fetch_sync(self, city, deadline=None):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super().fetch_sync(city, deadline)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_provider_limits_direct_concurrent_fetches():
+    provider = CountingProvider(max_concurrency=2)
+
+    async def fetch_all():
+        return await asyncio.gather(*(provider.fetch(city) for city in vipv.cities))
+
+    asyncio.run(fetch_all())
+    assert provider.peak == 2
+
+
+def test_stub_mode_is_seeded_and_matches_provider_horizon():
+    first = vipv.make_forecast_provider(vipv.SolarcastProvider("key"), mode="stub")
+    second = vipv.make_forecast_provider(vipv.SolarcastProvider("key"), mode="stub")
+    assert first.name == "Solarcast API"
+    assert len(first.fetch_sync('Dubai')) == vipv.SolarcastProvider.horizon_days == 6
+    assert first.fetch_sync('Dubai') == second.fetch_sync('Dubai')
+    tutiempo = vipv.make_forecast_provider(vipv.TutiempoProvider(), mode="stub")
+    assert len(tutiempo.fetch_sync('Madrid')) == 15
+
+
+def test_supports_selects_forecast_sources():
+    assert vipv.TutiempoProvider.supports('Madrid')
+    assert not vipv.TutiempoProvider.supports('Dubai')
+    assert all(vipv.SolarcastProvider.supports(city) for city in vipv.city_coordinates)
+
+
+def test_provider_requires_fetch_sync():
+    with pytest.raises(TypeError):
+        vipv.ForecastProvider()
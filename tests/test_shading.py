@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+import pytest
+
+import vipv_tool as vipv
+
+TILTS = [0, 5, 15, 25, 30, 45, 90]
+
+
+@pytest.mark.parametrize("city", vipv.cities)
+def test_open_lot_keeps_all_irradiation(city):
+    assert np.array_equal(vipv.shading_factors(city, 'Open Lot', TILTS), np.ones((len(TILTS), 12)))
+
+
+@pytest.mark.parametrize("city", vipv.cities)
+def test_deck_presets_are_ordered(city):
+    open_lot = vipv.shading_factors(city, 'Open Lot', TILTS)
+    top_deck = vipv.shading_factors(city, 'Multi-Storey (Top Deck)', TILTS)
+    covered_deck = vipv.shading_factors(city, 'Multi-Storey (Covered Deck)', TILTS)
+    assert np.all(covered_deck < top_deck)
+    assert np.all(top_deck <= open_lot)
+
+
+def test_horizon_csv_interpolates_across_north(tmp_path):
+    (tmp_path / "berlin.csv").write_text("# azimuth,elevation\n350,10\n10,30\n180,0\n")
+    profile = vipv.load_horizon_profile('Berlin', str(tmp_path))
+    assert profile.shape == (vipv.HORIZON_BINS,)
+    assert np.isclose(profile[-1], 15.0)  # Bin centred on 355°
+    assert np.isclose(profile[0], 25.0)   # Bin centred on 5°
+
+
+def test_missing_horizon_csv_is_flat(tmp_path):
+    assert np.array_equal(vipv.load_horizon_profile('Berlin', str(tmp_path)), np.zeros(vipv.HORIZON_BINS))
+
+
+def test_multi_tilt_call_matches_single_tilts():
+    combined = vipv.shading_factors('Madrid', 'Street Canyon (E-W)', TILTS)
+    for i, tilt in enumerate(TILTS):
+        assert np.allclose(combined[i], vipv.shading_factors('Madrid', 'Street Canyon (E-W)', [tilt])[0])
+
+
+@pytest.mark.parametrize("tilt", TILTS)
+@pytest.mark.parametrize("altitude", [2, 10, 30, 60, 89])
+def test_heading_average_matches_numeric_average(tilt, altitude):
+    t, a = np.radians(tilt), np.radians(altitude)
+    heading = np.linspace(0, 2 * np.pi, 200_001)[:-1]
+    numeric = np.maximum(np.cos(t) * np.sin(a) + np.sin(t) * np.cos(a) * np.cos(heading), 0).mean()
+    assert np.isclose(vipv.heading_averaged_incidence(t, a), numeric, atol=1e-6)
+
+
+def test_sun_positions_peak_at_solar_noon():
+    elevation, bins = vipv.sun_positions('Seville')
+    assert elevation.shape == bins.shape == (12, 96)
+    # Northern hemisphere: midday sun is due south, highest in June
+    assert np.all(bins[:, 48] == 18)
+    assert elevation[:, 48].argmax() == 5
+
+
+def test_shading_adds_a_small_constant_cost():
+    scenario = vipv.default_scenario('Dubai', 'Pick Up (Navara)')
+    start = time.perf_counter()
+    for _ in range(20):
+        vipv.calculate_results(scenario)
+    with_shading = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(20):
+        vipv.shading_factors('Dubai', 'Street Canyon (E-W)', TILTS)
+    shading_only = time.perf_counter() - start
+    assert shading_only < 0.25 * with_shading
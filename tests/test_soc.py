@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import vipv_tool as vipv
+
+
+def test_clamped_cumsum_matches_loop():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        steps = rng.normal(0, 3, rng.integers(1, 400))
+        lower, upper, initial = 2.0, rng.uniform(5, 15), 4.0
+        expected, x = [], initial
+        for step in steps:
+            x = min(max(x + step, lower), upper)
+            expected.append(x)
+        assert np.allclose(vipv.clamped_cumsum(steps, upper, lower, initial), expected)
+
+
+@pytest.mark.parametrize("target_soc", [80, 95, 100])
+def test_daily_and_flat_hourly_resolution_agree(target_soc):
+    solar = vipv.monthly_to_daily([5.0] * 12)
+    consumption = vipv.daily_consumption_profile(40, 20, 13)
+    daily = vipv.simulate_soc(solar, consumption, 40, target_soc, 20)
+    hourly = vipv.simulate_soc(vipv.daily_to_hourly(solar, np.ones(24)),
+                               vipv.daily_to_hourly(consumption, np.ones(24)), 40, target_soc, 20)
+
+    for key in ('curtailed', 'solar_used', 'grid_energy', 'plug_ins', 'avoided_plug_ins'):
+        assert np.isclose(daily[key], hourly[key]), key
+    assert np.allclose(daily['soc'], hourly['soc'][23::24])
+
+
+def test_solar_fills_free_capacity_before_curtailing():
+    # A 0.5 kWh/day surplus over 60 days fits in the 32 kWh above 20% SOC
+    solar = np.full(60, 5.0)
+    consumption = np.full(60, 4.5)
+    result = vipv.simulate_soc(solar, consumption, 40, target_soc=20, min_soc=10)
+    assert result['curtailed'] == 0
+    assert result['plug_ins'] == 0
+
+
+def test_capacity_sweep_matches_single_runs():
+    solar = vipv.monthly_to_daily([3.0] * 12)
+    consumption = vipv.daily_consumption_profile(60, 10, 15)
+    capacities = np.array([20, 40, 60])
+    sweep = vipv.simulate_soc(solar, consumption, capacities, 80, 20)
+    for i, capacity in enumerate(capacities):
+        single = vipv.simulate_soc(solar, consumption, capacity, 80, 20)
+        assert np.isclose(sweep['curtailed'][i], single['curtailed'])
+        assert np.isclose(sweep['avoided_plug_ins'][i], single['avoided_plug_ins'])
+
+
+def test_empty_plug_in_window_gives_nan():
+    solar = vipv.monthly_to_daily([3.0] * 12)
+    consumption = vipv.daily_consumption_profile(40, 20, 13)
+    result = vipv.simulate_soc(solar, consumption, 40, target_soc=50, min_soc=50)
+    assert np.isnan(result['plug_ins'])
+    assert np.isnan(result['avoided_plug_ins'])
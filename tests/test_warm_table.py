@@ -0,0 +1,58 @@
+import gzip
+import logging
+import os
+import threading
+
+import vipv_tool as vipv
+
+
+def test_background_build_failure_is_logged(monkeypatch, caplog):
+    def fail(entries):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(vipv, "build_warm_table", fail)
+    with caplog.at_level(logging.ERROR, logger="vipv_tool"):
+        vipv.build_warm_table_in_background({})
+    assert "warm result table failed" in caplog.text
+    assert "boom" in caplog.text
+
+
+def test_lookup_only_serves_default_scenarios():
+    scenario = vipv.default_scenario('Dubai', 'B-HB (Micra)')
+    entries = {vipv.warm_table_key('Dubai', 'B-HB (Micra)'): {'results': {'total_area': 1.0}, 'figures': {}}}
+    assert vipv.lookup_warm_results(entries, scenario) == ({'total_area': 1.0}, {})
+    scenario['electricity_price'] += 0.01
+    assert vipv.lookup_warm_results(entries, scenario) is None
+
+
+def test_truncated_table_counts_as_missing(tmp_path):
+    path = tmp_path / "warm.json.gz"
+    path.write_bytes(gzip.compress(b'{"fingerprint": "abc", "entries": {')[:-6])
+    assert vipv.load_warm_table(str(path)) is None
+    path.write_bytes(b"not gzip")
+    assert vipv.load_warm_table(str(path)) is None
+    path.write_bytes(gzip.compress(b'[1, 2]'))
+    assert vipv.load_warm_table(str(path)) is None
+
+
+def test_concurrent_builders_do_not_collide(tmp_path, monkeypatch):
+    monkeypatch.setattr(vipv, "cities", ['Dubai'])
+    monkeypatch.setattr(vipv, "segments", {'B-HB (Micra)': vipv.segments['B-HB (Micra)']})
+    path = str(tmp_path / "warm.json.gz")
+    errors = []
+
+    def build():
+        try:
+            vipv.build_warm_table({}, path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=build) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert list(vipv.load_warm_table(path)) == [vipv.warm_table_key('Dubai', 'B-HB (Micra)')]
+    assert os.listdir(tmp_path) == ["warm.json.gz"]
@@ -3,11 +3,33 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import plotly.express as px
+import plotly.io as pio
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import requests
 import datetime
 import time
+import abc
+import asyncio
+import concurrent.futures
+import functools
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import weakref
+import zlib
 from bs4 import BeautifulSoup
 
+logger = logging.getLogger("vipv_tool")
+
 plt.style.use('seaborn-v0_8-darkgrid')
 COLOR_PALETTE = ["#4C78A8", "#F58518", "#E45756", "#72B7B2", "#54A24B"]
 plt.rcParams['axes.prop_cycle'] = plt.cycler(color=COLOR_PALETTE)
@@ -217,98 +239,1345 @@ default_utilization = 90
 default_pv_efficiency = 25
 default_cost = 350
 default_transformation_efficiency = 90
+default_nissan_margin = 20
+default_nissan_volume = 500
+default_battery_capacity = 40
+default_target_soc = 80
+default_min_soc = 20
+default_weekday_km = 40
+default_weekend_km = 20
+
+# Forecast providers
+# Every provider returns the same normalized series, keyed by day label:
+#   {'Today': {'date': 'YYYY-MM-DD', 'radiation': kWh/m²/day or None, 'hourly': [24 x kWh/m²] or None}, ...}
+FORECAST_MODE = os.environ.get("VIPV_FORECAST_MODE", "live")  # live, record, replay or stub
+FORECAST_SEED = int(os.environ.get("VIPV_FORECAST_SEED", "0"))  # Keeps stub forecasts stable across reruns
+FORECAST_DIR = os.environ.get("VIPV_FORECAST_DIR", "forecast_recordings")
+
+def forecast_day_label(i):
+    """Day label used across all forecast providers"""
+    return "Today" if i == 0 else f"Day +{i}"
+
+def normalize_forecast(daily_values, hourly_values=None, start_date=None):
+    """Build the normalized forecast series from a list of daily irradiation values"""
+    start_date = start_date or datetime.date.today()
+    forecast = {}
+    for i, radiation in enumerate(daily_values):
+        hourly = hourly_values[i] if hourly_values and i < len(hourly_values) else None
+        forecast[forecast_day_label(i)] = {
+            'date': (start_date + datetime.timedelta(days=i)).isoformat(),
+            'radiation': float(radiation) if radiation is not None else None,
+            'hourly': [float(v) for v in hourly] if hourly is not None else None
+        }
+    return forecast
+
+def clear_sky_profile(daily_value, latitude=0.0, date=None):
+    """Spread a daily irradiation value over 24 hours with a half-sine daylight profile"""
+    date = date or datetime.date.today()
+    day_of_year = date.timetuple().tm_yday
+    declination = np.radians(23.45) * np.sin(2 * np.pi * (284 + day_of_year) / 365)
+    cos_hour_angle = np.clip(-np.tan(np.radians(latitude)) * np.tan(declination), -1, 1)
+    half_day = np.degrees(np.arccos(cos_hour_angle)) / 15
+    hours = np.arange(24) + 0.5
+    profile = np.where(np.abs(hours - 12) < half_day, np.cos(np.pi * (hours - 12) / (2 * max(half_day, 0.5))), 0.0)
+    return daily_value * profile / profile.sum() if profile.sum() > 0 else np.zeros(24)
+
+# Forecast fetches run here rather than on asyncio's default executor, which asyncio.run
+# waits for on shutdown; a timed-out fetch must not keep the Streamlit run blocked.
+forecast_executor = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="forecast")
+
+class ForecastProvider(abc.ABC):
+    """Base class for forecast sources with per-provider timeout and concurrency settings"""
+    name = "Forecast"
+    timeout = 15
+    max_concurrency = 4
+    horizon_days = 15
+
+    def __init__(self, timeout=None, max_concurrency=None):
+        if timeout is not None:
+            self.timeout = timeout
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        self._limiters = weakref.WeakKeyDictionary()
+        self._limiters_lock = threading.Lock()
 
-# Solarcast API functions with robust error handling
-def get_solarcast_forecast(api_key, latitude, longitude):
-    """Fetch solar forecast data from Solarcast API with robust error handling"""
+    @classmethod
+    def supports(cls, city):
+        return city in city_coordinates
+
+    @abc.abstractmethod
+    def fetch_sync(self, city, deadline=None):
+        """Blocking fetch returning the normalized series, raising on failure or past the deadline"""
+
+    def limiter(self):
+        """Semaphore holding every fetch of this provider on the running loop to max_concurrency"""
+        loop = asyncio.get_running_loop()
+        with self._limiters_lock:
+            if loop not in self._limiters:
+                self._limiters[loop] = asyncio.Semaphore(self.max_concurrency)
+            return self._limiters[loop]
+
+    def remaining(self, deadline):
+        """Seconds left before a time.monotonic() deadline, raising TimeoutError once it has passed"""
+        if deadline is None:
+            return float(self.timeout)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"{self.name} timed out after {self.timeout} s")
+        return remaining
+
+    def sleep(self, seconds, deadline):
+        """Sleep without overrunning the deadline"""
+        remaining = self.remaining(deadline)
+        time.sleep(min(seconds, remaining))
+        if seconds > remaining:
+            raise TimeoutError(f"{self.name} timed out after {self.timeout} s")
+
+    async def fetch(self, city):
+        """Fetch a forecast in a worker thread, bounded by the provider timeout and concurrency"""
+        async with self.limiter():
+            deadline = time.monotonic() + self.timeout
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(loop.run_in_executor(forecast_executor, self.fetch_sync, city, deadline),
+                                          self.timeout)
+
+class SolarcastProvider(ForecastProvider):
+    """Solarcast API forecast for the next 5 days"""
+    name = "Solarcast API"
     base_url = "https://api.solarcast.io/forecast"
-    params = {
-        "lat": latitude,
-        "lon": longitude,
-        "apikey": api_key
-    }
-    
-    try:
-        # Increased timeout to 15 seconds for read operations
-        response = requests.get(base_url, params=params, timeout=(5, 15))
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.Timeout:
-        st.warning("Solarcast API timed out. This might be due to network issues or high API load. Using monthly averages instead.")
-        return None
-    except requests.exceptions.RequestException as e:
-        st.warning(f"Could not retrieve solar forecast: {str(e)}. Using monthly averages.")
-        return None
-    except Exception as e:
-        st.warning(f"Unexpected error: {str(e)}. Using monthly averages.")
-        return None
+    timeout = 62  # 3 attempts of (5 s connect + 15 s read) with 1 s backoff between them
+    horizon_days = 6  # Today + next 5 days
+    retries = 3
 
-def extract_forecast_days(forecast_data):
-    """Extract forecast for the next 5 days from API response"""
-    if not forecast_data or "daily" not in forecast_data:
-        return None
-    
-    today = datetime.date.today()
-    forecast_days = {}
-    
-    for i in range(6):  # Today + next 5 days
-        date_str = (today + datetime.timedelta(days=i)).isoformat()
-        if date_str in forecast_data["daily"]:
-            day_label = "Today" if i == 0 else f"Day +{i}"
-            forecast_days[day_label] = forecast_data["daily"][date_str]["solar_irradiance"]
-    
-    return forecast_days
-
-# Tutiempo.net web scraping for Spanish cities
-def get_tutiempo_forecast(city):
-    """Get solar irradiation forecast from Tutiempo.net for Spanish cities"""
-    try:
+    def __init__(self, api_key, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+
+    def fetch_sync(self, city, deadline=None):
+        coords = city_coordinates[city]
+        params = {"lat": coords['lat'], "lon": coords['lon'], "apikey": self.api_key}
+        for attempt in range(self.retries):
+            remaining = self.remaining(deadline)
+            try:
+                response = requests.get(self.base_url, params=params,
+                                        timeout=(min(5, remaining), min(15, remaining)))
+                response.raise_for_status()
+                return self.parse(response.json())
+            except requests.exceptions.RequestException:
+                if attempt == self.retries - 1:
+                    raise
+                self.sleep(1, deadline)  # Wait before retrying
+
+    @classmethod
+    def parse(cls, forecast_data):
+        """Reduce a Solarcast response to the normalized series (daily values only)"""
+        if not forecast_data or "daily" not in forecast_data:
+            raise ValueError("Forecast data format not recognized")
+        today = datetime.date.today()
+        daily = []
+        for i in range(cls.horizon_days):
+            date_str = (today + datetime.timedelta(days=i)).isoformat()
+            day = forecast_data["daily"].get(date_str)
+            if day is None:
+                break
+            daily.append(day["solar_irradiance"])
+        if not daily:
+            raise ValueError("Forecast data format not recognized")
+        return normalize_forecast(daily, start_date=today)
+
+class TutiempoProvider(ForecastProvider):
+    """Solar irradiation forecast scraped from Tutiempo.net for Spanish cities"""
+    name = "Tutiempo"
+    timeout = 10
+    max_concurrency = 2  # Be polite to the site
+
+    @classmethod
+    def supports(cls, city):
+        return city in tutiempo_urls
+
+    def fetch_sync(self, city, deadline=None):
         url = tutiempo_urls.get(city)
         if not url:
-            return None
-            
+            raise ValueError(f"Tutiempo does not cover {city}")
+
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        response = requests.get(url, headers=headers, timeout=10)
+        response = requests.get(url, headers=headers, timeout=self.remaining(deadline))
         response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Find the table with forecast data
+        return self.parse(response.content)
+
+    @classmethod
+    def parse(cls, content):
+        """Extract the next 15 days of solar irradiation from the forecast table"""
+        soup = BeautifulSoup(content, 'html.parser')
         table = soup.find('table', class_='medias')
         if not table:
-            return None
-            
-        # Extract the next 15 days of solar irradiation
-        forecast = {}
-        rows = table.find_all('tr')[1:16]  # Next 15 days
-        
-        today = datetime.date.today()
-        for i, row in enumerate(rows):
+            raise ValueError("Forecast table not found")
+
+        daily = []
+        for row in table.find_all('tr')[1:cls.horizon_days + 1]:
             cols = row.find_all('td')
+            radiation = None
             if len(cols) >= 5:
-                # Extract solar radiation value
-                radiation = cols[4].get_text().strip()
                 try:
-                    radiation_value = float(radiation)
+                    radiation = float(cols[4].get_text().strip())
                 except ValueError:
-                    radiation_value = None
-                    
-                # Create day label
-                day_label = "Today" if i == 0 else f"Day +{i}"
-                forecast_date = today + datetime.timedelta(days=i)
-                
-                forecast[day_label] = {
-                    'date': forecast_date.strftime("%Y-%m-%d"),
-                    'radiation': radiation_value
-                }
-                
+                    pass
+            # Keep incomplete rows so later days keep their date and label
+            daily.append(radiation)
+        return normalize_forecast(daily)
+
+class StubProvider(ForecastProvider):
+    """Offline forecast synthesized from monthly averages, with optional simulated latency"""
+    name = "Stub"
+
+    def __init__(self, days=15, latency=0.0, jitter=0.0, noise=0.1, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.days = days
+        self.latency = latency
+        self.jitter = jitter
+        self.noise = noise
+        self.seed = seed
+
+    @classmethod
+    def supports(cls, city):
+        return city in irradiation_data
+
+    def fetch_sync(self, city, deadline=None):
+        # Generators are not thread-safe, so every call draws from its own (seed, city) stream
+        rng = np.random.default_rng(None if self.seed is None else [self.seed, zlib.crc32(city.encode())])
+        if self.latency or self.jitter:
+            self.sleep(max(0.0, self.latency + rng.normal(0, self.jitter)), deadline)
+        today = datetime.date.today()
+        dates = [today + datetime.timedelta(days=i) for i in range(self.days)]
+        monthly = np.array(irradiation_data[city])[[d.month - 1 for d in dates]]
+        daily = monthly * np.clip(1 + rng.normal(0, self.noise, self.days), 0, None)
+        latitude = city_coordinates.get(city, {'lat': 0.0})['lat']
+        hourly = [clear_sky_profile(v, latitude, d) for v, d in zip(daily, dates)]
+        return normalize_forecast(daily, hourly, today)
+
+class RecordingProvider(ForecastProvider):
+    """Wrap a provider and store every normalized response as JSON for later replay"""
+
+    def __init__(self, inner, directory=FORECAST_DIR, **kwargs):
+        super().__init__(timeout=inner.timeout, max_concurrency=inner.max_concurrency, **kwargs)
+        self.inner = inner
+        self.name = inner.name
+        self.directory = directory
+
+    def supports(self, city):
+        return self.inner.supports(city)
+
+    def fetch_sync(self, city, deadline=None):
+        forecast = self.inner.fetch_sync(city, deadline)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(recording_path(self.directory, self.name, city), 'w') as f:
+            json.dump(forecast, f)
         return forecast
-        
+
+class ReplayProvider(ForecastProvider):
+    """Serve forecasts recorded by RecordingProvider, optionally with simulated latency"""
+
+    def __init__(self, name, directory=FORECAST_DIR, latency=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+        self.directory = directory
+        self.latency = latency
+
+    def supports(self, city):
+        return os.path.exists(recording_path(self.directory, self.name, city))
+
+    def fetch_sync(self, city, deadline=None):
+        if self.latency:
+            self.sleep(self.latency, deadline)
+        with open(recording_path(self.directory, self.name, city)) as f:
+            return json.load(f)
+
+def recording_path(directory, provider_name, city):
+    """File holding the recorded forecast of a provider for a city"""
+    slug = provider_name.lower().replace(' ', '_')
+    return os.path.join(directory, f"{slug}_{city.lower()}.json")
+
+def make_forecast_provider(provider, mode=FORECAST_MODE, directory=FORECAST_DIR):
+    """Apply the record/replay/stub mode to a live provider"""
+    if mode == "record":
+        return RecordingProvider(provider, directory)
+    if mode == "replay":
+        return ReplayProvider(provider.name, directory)
+    if mode == "stub":
+        # Seeded so reruns show the same forecast, and limited to what the real source covers
+        stub = StubProvider(days=provider.horizon_days, seed=FORECAST_SEED)
+        stub.name = provider.name
+        return stub
+    return provider
+
+async def fetch_forecasts(provider, cities):
+    """Fetch forecasts for many cities concurrently; failed fetches map to their exception"""
+    results = await asyncio.gather(*(provider.fetch(city) for city in cities), return_exceptions=True)
+    return dict(zip(cities, results))
+
+def fetch_forecast(provider, city):
+    """Fetch a single forecast, warning and returning None on failure"""
+    try:
+        return asyncio.run(provider.fetch(city))
+    except (TimeoutError, requests.exceptions.Timeout):
+        st.warning(f"{provider.name} timed out after {provider.timeout} s. This might be due to network issues or high API load. Using monthly averages instead.")
+    except requests.exceptions.RequestException as e:
+        st.warning(f"Could not retrieve {provider.name} forecast: {str(e)}. Using monthly averages.")
     except Exception as e:
-        st.warning(f"Could not retrieve Tutiempo forecast: {str(e)}")
+        st.warning(f"Unexpected error from {provider.name}: {str(e)}. Using monthly averages.")
+    return None
+
+# Battery state-of-charge simulation
+days_in_month = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+# Share of the daily driving energy drawn in each hour (morning and evening commute)
+driving_hours_profile = np.zeros(24)
+driving_hours_profile[[7, 8, 17, 18]] = 0.25
+
+def monthly_to_daily(monthly_values):
+    """Expand 12 monthly kWh/day values to a 365-day series (last axis)"""
+    return np.repeat(np.asarray(monthly_values, dtype=float), days_in_month, axis=-1)
+
+def daily_to_hourly(daily_values, hourly_profile):
+    """Split daily kWh values over 24 hours following a profile (normalized to sum to 1)"""
+    hourly_profile = np.asarray(hourly_profile, dtype=float)
+    hourly_profile = hourly_profile / hourly_profile.sum()
+    daily_values = np.asarray(daily_values, dtype=float)
+    hourly = daily_values[..., None] * hourly_profile
+    return hourly.reshape(daily_values.shape[:-1] + (-1,))
+
+def daily_consumption_profile(weekday_km, weekend_km, efficiency, days=365, start_weekday=0):
+    """Daily driving energy (kWh) from weekday/weekend distances and efficiency (kWh/100km)"""
+    weekday = (np.arange(days) + start_weekday) % 7
+    weekday_km = np.asarray(weekday_km, dtype=float)[..., None]
+    weekend_km = np.asarray(weekend_km, dtype=float)[..., None]
+    efficiency = np.asarray(efficiency, dtype=float)[..., None]
+    return np.where(weekday < 5, weekday_km, weekend_km) * efficiency / 100
+
+def clamped_cumsum(steps, upper, lower=0.0, initial=0.0):
+    """Running sum clamped to [lower, upper] after every step (last axis)
+
+    Each step is the map x -> clip(x + a, l, h), and these maps compose into the same
+    form, so the running state is a log-depth prefix scan over (a, l, h) rather than
+    a loop over steps.
+    """
+    a = np.array(steps, dtype=float)
+    shape = np.broadcast_shapes(a.shape, np.shape(lower), np.shape(upper))
+    a = np.broadcast_to(a, shape).copy()
+    low = np.broadcast_to(np.asarray(lower, dtype=float), shape).copy()
+    high = np.broadcast_to(np.asarray(upper, dtype=float), shape).copy()
+
+    shift = 1
+    while shift < shape[-1]:
+        step_a, step_low, step_high = a[..., shift:], low[..., shift:], high[..., shift:]
+        new_low = np.clip(low[..., :-shift] + step_a, step_low, step_high)
+        new_high = np.clip(high[..., :-shift] + step_a, step_low, step_high)
+        new_a = a[..., :-shift] + step_a
+        a[..., shift:], low[..., shift:], high[..., shift:] = new_a, new_low, new_high
+        shift *= 2
+
+    return np.clip(initial + a, low, high)
+
+def simulate_soc(solar, consumption, capacity, target_soc=80, min_soc=20):
+    """Simulate battery state of charge over a solar/consumption series
+
+    solar and consumption are kWh per step (daily or hourly) with shape (..., steps);
+    capacity (kWh), target_soc and min_soc (%) may be arrays over the leading scenario
+    axes. The battery starts at target_soc, solar charges any free capacity and only the
+    overflow above full capacity is curtailed. Driving drains the battery down to
+    min_soc, below which the grid tops it up; that grid energy is counted in plug-in
+    sessions of (target_soc - min_soc) each. Plug-ins are NaN when that window is empty.
+    """
+    capacity = np.asarray(capacity, dtype=float)[..., None]
+    target_soc = np.asarray(target_soc, dtype=float)[..., None]
+    min_soc = np.asarray(min_soc, dtype=float)[..., None]
+    solar = np.asarray(solar, dtype=float)
+    consumption = np.asarray(consumption, dtype=float)
+
+    floor = capacity * min_soc / 100
+    initial = capacity * target_soc / 100
+    plug_in_window = (initial - floor)[..., 0]
+
+    # Battery energy, held between the plug-in threshold and full capacity
+    net = solar - consumption
+    stored = clamped_cumsum(net, capacity, floor, initial)
+    previous = np.concatenate([np.broadcast_to(initial, stored[..., :1].shape), stored[..., :-1]], axis=-1)
+    unclamped = previous + net
+    curtailed = np.maximum(unclamped - capacity, 0)
+    grid_energy = np.maximum(floor - unclamped, 0).sum(axis=-1)
+
+    # Without solar the battery drains monotonically, so the grid covers everything past the window
+    baseline_grid_energy = np.maximum(consumption.sum(axis=-1) - plug_in_window, 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Rounded first so float noise does not open an extra session
+        plug_ins = np.where(plug_in_window > 0, np.ceil(np.round(grid_energy / plug_in_window, 9)), np.nan)
+        baseline_plug_ins = np.where(plug_in_window > 0,
+                                     np.ceil(np.round(baseline_grid_energy / plug_in_window, 9)), np.nan)
+
+    return {
+        'soc': stored / capacity * 100,
+        'solar_used': solar.sum(axis=-1) - curtailed.sum(axis=-1),
+        'curtailed': curtailed.sum(axis=-1),
+        'grid_energy': grid_energy,
+        'plug_ins': plug_ins,
+        'baseline_plug_ins': baseline_plug_ins,
+        'avoided_plug_ins': baseline_plug_ins - plug_ins
+    }
+
+# Urban shading and horizon profiles
+# Horizons are stored as elevation angles (°) over azimuth bins clockwise from north, so
+# occlusion is a lookup-and-compare mask over precomputed sun positions.
+HORIZON_BINS = 36  # 10° azimuth bins
+HORIZON_DIR = os.environ.get("VIPV_HORIZON_DIR", "horizon_profiles")
+horizon_azimuths = (np.arange(HORIZON_BINS) + 0.5) * 360 / HORIZON_BINS
+diffuse_fraction = 0.3  # Share of irradiation arriving as isotropic sky diffuse
+
+def street_canyon_profile(street_azimuth, height_to_width=1.0):
+    """Horizon seen from the middle of a street canyon with the given axis and H/W ratio"""
+    offset = np.radians(horizon_azimuths - street_azimuth)
+    return np.degrees(np.arctan(2 * height_to_width * np.abs(np.sin(offset))))
+
+# Sun is visible between horizon and ceiling elevations in each azimuth bin
+parking_contexts = {
+    'Open Lot': {
+        'horizon': np.zeros(HORIZON_BINS),
+        'ceiling': np.full(HORIZON_BINS, 90.0)
+    },
+    'Street Canyon (E-W)': {
+        'horizon': street_canyon_profile(90),
+        'ceiling': np.full(HORIZON_BINS, 90.0)
+    },
+    'Street Canyon (N-S)': {
+        'horizon': street_canyon_profile(0),
+        'ceiling': np.full(HORIZON_BINS, 90.0)
+    },
+    'Multi-Storey (Top Deck)': {
+        'horizon': np.full(HORIZON_BINS, 5.0),  # Parapets and neighbouring buildings
+        'ceiling': np.full(HORIZON_BINS, 90.0)
+    },
+    'Multi-Storey (Covered Deck)': {
+        'horizon': np.full(HORIZON_BINS, 5.0),
+        'ceiling': np.full(HORIZON_BINS, 15.0)  # ~2.5 m clearance, ~9 m to the open side
+    }
+}
+default_parking_context = 'Open Lot'
+
+def load_horizon_profile(city, directory=HORIZON_DIR):
+    """Azimuth-binned horizon for a city from <city>.csv (azimuth, elevation in degrees), flat if missing"""
+    path = os.path.join(directory, f"{city.lower()}.csv")
+    if not os.path.exists(path):
+        return np.zeros(HORIZON_BINS)
+    azimuth, elevation = np.loadtxt(path, delimiter=',', comments='#', ndmin=2).T
+    return np.interp(horizon_azimuths, azimuth, elevation, period=360)
+
+horizon_profiles = {city: load_horizon_profile(city) for city in cities}
+
+@functools.lru_cache(maxsize=None)
+def sun_positions(city):
+    """Solar elevation (°) and azimuth bin on mid-month days in 15-minute steps, shape (12, 96)"""
+    latitude = np.radians(city_coordinates.get(city, {'lat': 0.0})['lat'])
+    day_of_year = np.cumsum([0] + days_in_month[:-1]) + 15
+    declination = (np.radians(23.45) * np.sin(2 * np.pi * (284 + day_of_year) / 365))[:, None]
+    hour_angle = np.radians(15 * ((np.arange(96) + 0.5) / 4 - 12))
+
+    sin_elevation = (np.sin(latitude) * np.sin(declination) +
+                     np.cos(latitude) * np.cos(declination) * np.cos(hour_angle))
+    elevation = np.degrees(np.arcsin(np.clip(sin_elevation, -1, 1)))
+    azimuth = np.degrees(np.arctan2(-np.cos(declination) * np.sin(hour_angle),
+                                    np.sin(declination) * np.cos(latitude) -
+                                    np.cos(declination) * np.sin(latitude) * np.cos(hour_angle))) % 360
+    bins = (azimuth // (360 / HORIZON_BINS)).astype(int) % HORIZON_BINS
+    return elevation, bins
+
+def heading_averaged_incidence(tilt, altitude):
+    """Mean of max(cos θ, 0) for beam incidence on a tilted surface over a uniformly random heading
+
+    cos θ = A + B·cos φ with A = cos(tilt)·sin(altitude), B = sin(tilt)·cos(altitude) and φ
+    the heading relative to the sun; the surface is lit for |φ| < φ0 = arccos(-A/B), so the
+    mean is (A·φ0 + B·sin φ0) / π, which is A when the surface never faces away (A ≥ B).
+    """
+    a = np.cos(tilt) * np.sin(altitude)
+    b = np.sin(tilt) * np.cos(altitude)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        phi0 = np.arccos(np.clip(np.where(b > 0, -a / b, -1.0), -1, 1))
+    return (a * phi0 + b * np.sin(phi0)) / np.pi
+
+def shading_factors(city, parking_context, tilts):
+    """Monthly share of unshaded irradiation kept for surfaces of the given tilts, shape (len(tilts), 12)"""
+    elevation, bins = sun_positions(city)
+    context = parking_contexts[parking_context]
+    horizon = np.maximum(horizon_profiles.get(city, np.zeros(HORIZON_BINS)), context['horizon'])
+    ceiling = np.maximum(context['ceiling'], horizon)
+    visible = (elevation > horizon[bins]) & (elevation < ceiling[bins])
+
+    tilt = np.radians(np.asarray(tilts, dtype=float))[:, None, None]
+    weights = np.where(elevation > 0, heading_averaged_incidence(tilt, np.radians(elevation)), 0)
+    beam = (weights * visible).sum(axis=-1) / np.maximum(weights.sum(axis=-1), 1e-12)
+
+    # Isotropic diffuse from the open band of sky between horizon and ceiling
+    sky = np.mean(np.sin(np.radians(ceiling)) ** 2 - np.sin(np.radians(horizon)) ** 2)
+    return (1 - diffuse_fraction) * beam + diffuse_fraction * sky
+
+# Results calculation
+months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+def default_surfaces_config(segment):
+    """Surface configuration the Assumptions tab starts with for a segment"""
+    surfaces_config = {}
+    for surface_name, surface_data in segments[segment]['surfaces'].items():
+        if surface_data.get('default', True):
+            surfaces_config[surface_name] = {
+                'area': surface_data['area'],
+                'utilization': default_utilization,
+                'angle': surface_data['angle'],
+                'efficiency': default_pv_efficiency,
+                'cost': default_cost,
+                'include': True
+            }
+        else:
+            surfaces_config[surface_name] = {'include': False}
+    return surfaces_config
+
+def default_scenario(region, segment):
+    """Inputs of a session that keeps every default for a city and segment"""
+    return {
+        'region': region,
+        'segment': segment,
+        'parking_context': default_parking_context,
+        'irradiation': irradiation_data[region],
+        'hourly_irradiation': None,
+        'data_source': "Monthly Average",
+        'electricity_price': energy_cost[region],
+        'nissan_margin': default_nissan_margin,
+        'nissan_volume': default_nissan_volume,
+        'surfaces_config': default_surfaces_config(segment),
+        'transformation_efficiency': default_transformation_efficiency,
+        'battery_capacity': default_battery_capacity,
+        'target_soc': default_target_soc,
+        'min_soc': default_min_soc,
+        'weekday_km': default_weekday_km,
+        'weekend_km': default_weekend_km,
+        'driving_cycle': "WLTP"
+    }
+
+def calculate_results(scenario):
+    """Compute every figure shown in the Visualization tab for a scenario"""
+    segment_data = segments[scenario['segment']]
+    irradiation_to_use = list(scenario['irradiation'])
+    transformation_efficiency = scenario['transformation_efficiency']
+
+    # Calculate PV energy production for each surface
+    total_area = 0
+    total_daily_energy = 0
+    total_cost = 0
+    monthly_energy = {month: 0 for month in months}
+    surfaces_results = []
+
+    # Occlusion by the horizon and parking context, for all included surfaces at once
+    included = [name for name, config in scenario['surfaces_config'].items() if config.get('include', False)]
+    tilts = [scenario['surfaces_config'][name]['angle'] for name in included]
+    shading = dict(zip(included, shading_factors(scenario['region'], scenario['parking_context'], tilts)))
+
+    for surface_name, config in scenario['surfaces_config'].items():
+        if config.get('include', False):
+            # Calculate for each month
+            monthly_surface_energy = []
+            for month_idx, month in enumerate(monthly_energy.keys()):
+                # Adjust irradiation by angle (simple cosine correction) and shading
+                angle_rad = np.radians(config['angle'])
+                effective_irradiation = irradiation_to_use[month_idx] * np.cos(angle_rad) * shading[surface_name][month_idx]
+
+                # Calculate energy for this month
+                area = config['area'] * (config['utilization']/100)
+                energy = area * effective_irradiation * (config['efficiency']/100) * (transformation_efficiency/100)
+
+                # For side windows, multiply by 2 (left and right)
+                if 'side' in surface_name:
+                    energy *= 2
+
+                monthly_surface_energy.append(float(energy))
+                monthly_energy[month] += float(energy)
+
+            # Calculate average daily energy
+            avg_daily_energy = float(np.mean(monthly_surface_energy))
+
+            # Calculate cost (not multiplied for side windows - cost is per panel)
+            cost = config['area'] * config['cost']
+            if 'side' in surface_name:
+                cost *= 2
+
+            surfaces_results.append({
+                'name': surface_name.replace('_', ' ').title(),
+                'area': config['area'],
+                'effective_area': config['area'] * (config['utilization']/100),
+                'avg_daily_energy': avg_daily_energy,
+                'monthly_energy': monthly_surface_energy,
+                'cost': cost
+            })
+
+            total_area += config['area'] * (config['utilization']/100) * (2 if 'side' in surface_name else 1)
+            total_daily_energy += avg_daily_energy
+            total_cost += cost
+
+    # Calculate average efficiency
+    if total_area > 0:
+        avg_efficiency = (total_daily_energy / (total_area * np.mean(irradiation_to_use) * (transformation_efficiency/100))) * 100
+    else:
+        avg_efficiency = 0
+
+    # Calculate ranges
+    wltp_range = (total_daily_energy / (segment_data['wltp'] / 100))  # Convert to km
+    city_range = (total_daily_energy / (segment_data['city'] / 100))
+
+    # Calculate monthly ranges
+    monthly_wltp_range = [energy / (segment_data['wltp'] / 100) for energy in monthly_energy.values()]
+    monthly_city_range = [energy / (segment_data['city'] / 100) for energy in monthly_energy.values()]
+
+    # Calculate annual savings and payback period
+    annual_energy_kwh = sum(monthly_energy.values()) * 30.44  # Average days per month
+    annual_savings = annual_energy_kwh * scenario['electricity_price']  # Now in EUR
+    payback_period = total_cost / annual_savings if annual_savings > 0 else float('inf')
+
+    # Calculate Nissan Annual Profit (in k€)
+    nissan_profit = (total_cost * (scenario['nissan_margin']/100) * scenario['nissan_volume']) / 1000
+
+    # Battery state of charge over the year
+    consumption_efficiency = segment_data['wltp'] if scenario['driving_cycle'] == "WLTP" else segment_data['city']
+    daily_solar = monthly_to_daily(list(monthly_energy.values()))
+    daily_consumption = daily_consumption_profile(scenario['weekday_km'], scenario['weekend_km'], consumption_efficiency)
+    hourly_irradiation = scenario['hourly_irradiation']
+    if hourly_irradiation is not None and sum(hourly_irradiation) > 0:
+        # Hourly resolution: solar follows the forecast profile, driving the commute hours
+        solar_series = daily_to_hourly(daily_solar, hourly_irradiation)
+        consumption_series = daily_to_hourly(daily_consumption, driving_hours_profile)
+        steps_per_day = 24
+    else:
+        solar_series, consumption_series, steps_per_day = daily_solar, daily_consumption, 1
+
+    soc_result = simulate_soc(solar_series, consumption_series, scenario['battery_capacity'],
+                              scenario['target_soc'], scenario['min_soc'])
+
+    # All capacities are simulated at once as separate scenarios
+    capacities = np.arange(20, 125, 5)
+    sweep = simulate_soc(solar_series, consumption_series, capacities,
+                         scenario['target_soc'], scenario['min_soc'])
+
+    return {
+        'data_source': scenario['data_source'],
+        'parking_context': scenario['parking_context'],
+        'irradiation': irradiation_to_use,
+        'total_area': float(total_area),
+        'avg_efficiency': float(avg_efficiency),
+        'total_daily_energy': float(total_daily_energy),
+        'wltp_range': float(wltp_range),
+        'city_range': float(city_range),
+        'monthly_energy': list(monthly_energy.values()),
+        'monthly_wltp_range': monthly_wltp_range,
+        'monthly_city_range': monthly_city_range,
+        'annual_energy_kwh': float(annual_energy_kwh),
+        'annual_savings': float(annual_savings),
+        'total_cost': float(total_cost),
+        'payback_period': float(payback_period),
+        'nissan_volume': scenario['nissan_volume'],
+        'nissan_margin': scenario['nissan_margin'],
+        'nissan_profit': float(nissan_profit),
+        'surfaces_results': surfaces_results,
+        'avoided_plug_ins': float(soc_result['avoided_plug_ins']),
+        'plug_ins': float(soc_result['plug_ins']),
+        'solar_used': float(soc_result['solar_used']),
+        'curtailed': float(soc_result['curtailed']),
+        'daily_soc': soc_result['soc'][steps_per_day - 1::steps_per_day].tolist(),
+        'sweep_capacities': capacities.tolist(),
+        'sweep_avoided_plug_ins': sweep['avoided_plug_ins'].tolist(),
+        'sweep_curtailed': sweep['curtailed'].tolist()
+    }
+
+def build_figures(results):
+    """Build the Visualization tab charts from calculated results"""
+    data_source = results['data_source']
+    figures = {}
+
+    # ---- Modern Visualization 1: Dual Metric Energy Chart ----
+    # Convert to DataFrame and adjust units
+    monthly_df = pd.DataFrame({
+        'Month': months,
+        'Irradiation (kWh/m²/day)': results['irradiation'],
+        'Energy Gain (kWh/day)': results['monthly_energy']
+    })
+
+    # Create figure with secondary y-axis
+    fig = px.line(monthly_df,
+                x='Month',
+                y=['Irradiation (kWh/m²/day)', 'Energy Gain (kWh/day)'],
+                title=f'<b>Monthly Solar Energy Performance ({data_source})</b>',
+                labels={'value': 'Energy (kWh)', 'variable': 'Metric'},
+                color_discrete_sequence=['#FFA15A', '#636EFA'],
+                template='plotly_white')
+
+    # Formatting updates
+    fig.update_layout(
+        hovermode="x unified",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family="Arial", size=12),
+        yaxis=dict(
+            title='Energy (kWh)',
+            tickformat=".1f",
+            range=[0, max(monthly_df['Irradiation (kWh/m²/day)'].max(),
+                    monthly_df['Energy Gain (kWh/day)'].max()) * 1.1]
+        ),
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )
+
+    # Customize hover data
+    fig.update_traces(
+        hovertemplate="<b>%{x}</b><br>" +
+                    "%{yaxis.title.text}: %{y:.1f} kWh<extra></extra>"
+    )
+    figures['energy'] = fig
+
+    # ---- Modern Visualization 2: Range Gain Bars ----
+    range_df = pd.DataFrame({
+        'Month': months,
+        'WLTP Range': results['monthly_wltp_range'],
+        'City Range': results['monthly_city_range']
+    })
+
+    fig2 = px.bar(range_df, x='Month', y=['WLTP Range', 'City Range'],
+                 barmode='group',
+                 title=f'<b>Additional Daily Driving Range ({data_source})</b>',
+                 labels={'value': 'Kilometers', 'variable': 'Cycle'},
+                 color_discrete_sequence=['#00CC96', '#AB63FA'])
+
+    # Set y-axis ticks to increment by 5km
+    max_range = max(max(results['monthly_wltp_range']), max(results['monthly_city_range']))
+    fig2.update_layout(
+        hovermode="x unified",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family="Arial", size=12),
+        yaxis=dict(
+            tickformat=".1f",
+            tickmode='linear',
+            tick0=0,
+            dtick=5,
+            range=[0, max_range * 1.1]
+        )
+    )
+    figures['range'] = fig2
+
+    # ---- Modern Visualization 3: Financial Outlook ----
+    # Create timeline (0 to max_years)
+    max_years = 10
+    years = list(range(0, max_years + 1))
+
+    # Cumulative savings grows each year
+    savings = [results['annual_savings'] * year for year in years]
+
+    # Investment remains constant (straight line)
+    investment = [results['total_cost']] * len(years)
+
+    profit_df = pd.DataFrame({
+        'Year': years,
+        'Cumulative Savings (€)': savings,
+        'Investment (€)': investment
+    })
+
+    # Calculate payback year (when savings >= investment)
+    payback_year = next((year for year in years if savings[year] >= investment[year]), None)
+
+    fig3 = px.line(profit_df, x='Year', y=['Cumulative Savings (€)', 'Investment (€)'],
+                  title='<b>Investment Payback Timeline</b>',
+                  color_discrete_sequence=['#19D3F3', '#FF6692'],
+                  markers=True)
+
+    if payback_year is not None:
+        # Add payback point marker
+        payback_value = savings[payback_year]
+        fig3.add_annotation(
+            x=payback_year,
+            y=payback_value,
+            text=f"Payback: {payback_year} years",
+            showarrow=True,
+            arrowhead=1,
+            ax=0,
+            ay=-40
+        )
+        # Add vertical line at payback point
+        fig3.add_vline(x=payback_year, line_dash="dash",
+                      line_color="gray")
+
+    fig3.update_layout(
+        hovermode="x unified",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family="Arial", size=12),
+        yaxis_title="Euros (€)",
+        xaxis=dict(
+            tickmode='linear',
+            tick0=0,
+            dtick=1
+        ),
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )
+
+    # Customize hover format
+    fig3.update_traces(
+        hovertemplate="<b>Year %{x}</b><br>%{y:,.0f} €<extra></extra>"
+    )
+    figures['payback'] = fig3
+
+    # ---- Modern Visualization 4: Surface Contribution ----
+    surfaces_results = results['surfaces_results']
+    if surfaces_results:
+        contrib_df = pd.DataFrame({
+            'Surface': [s['name'] for s in surfaces_results],
+            'Contribution (%)': [s['avg_daily_energy']/results['total_daily_energy']*100 for s in surfaces_results],
+            'Area (m²)': [s['effective_area'] for s in surfaces_results]
+        })
+
+        fig4 = px.sunburst(contrib_df, path=['Surface'], values='Contribution (%)',
+                          color='Area (m²)', color_continuous_scale='Blues',
+                          title=f'<b>Energy Contribution by Surface Area ({data_source})</b>')
+
+        fig4.update_layout(
+            margin=dict(t=40, l=0, r=0, b=0),
+            font=dict(family="Arial", size=12)
+        )
+        figures['contribution'] = fig4
+
+    # ---- Modern Visualization 5: Battery State of Charge ----
+    soc_df = pd.DataFrame({
+        'Day': np.arange(1, len(results['daily_soc']) + 1),
+        'SOC (%)': results['daily_soc']
+    })
+    fig5 = px.area(soc_df, x='Day', y='SOC (%)',
+                  title=f'<b>End-of-Day State of Charge ({data_source})</b>',
+                  color_discrete_sequence=['#636EFA'])
+    fig5.update_layout(
+        hovermode="x unified",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family="Arial", size=12),
+        yaxis=dict(range=[0, 100])
+    )
+    figures['soc'] = fig5
+
+    sweep_df = pd.DataFrame({
+        'Battery Capacity (kWh)': results['sweep_capacities'],
+        'Avoided Plug-in Charges': results['sweep_avoided_plug_ins'],
+        'Curtailed Energy (kWh)': results['sweep_curtailed']
+    })
+    fig6 = px.line(sweep_df, x='Battery Capacity (kWh)',
+                  y=['Avoided Plug-in Charges', 'Curtailed Energy (kWh)'],
+                  title='<b>Battery Capacity Sensitivity</b>',
+                  labels={'value': 'Per Year', 'variable': 'Metric'},
+                  color_discrete_sequence=['#00CC96', '#EF553B'],
+                  markers=True)
+    fig6.update_layout(
+        hovermode="x unified",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family="Arial", size=12),
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )
+    figures['capacity'] = fig6
+
+    return figures
+
+def render_results(results, figures):
+    """Display calculated results and their charts in the Visualization tab"""
+    data_source = results['data_source']
+    payback_period = results['payback_period']
+
+    # Display results
+    st.subheader("Feasibility Study Summary")
+    st.info(f"Using irradiation data: **{data_source}** · Parking context: **{results['parking_context']}**")
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Total Area", f"{results['total_area']:.2f} m²")
+        st.metric("Average Efficiency", f"{results['avg_efficiency']:.1f}%")
+        st.metric("Avg. Daily Output", f"{results['total_daily_energy']:.0f} kWh")
+
+    with col2:
+        st.metric("Avg. Daily Range (WLTP)", f"{results['wltp_range']:.1f} km")
+        st.metric("Avg. Daily Range (City)", f"{results['city_range']:.1f} km")
+        st.metric("Annual Energy Production", f"{results['annual_energy_kwh']:.0f} kWh")
+
+    with col3:
+        st.metric("Total Investment", f"{results['total_cost']:.0f} €")
+        st.metric("Annual Savings", f"{results['annual_savings']:.0f} €")
+        st.metric("Payback Period", f"{payback_period:.1f} years" if not np.isinf(payback_period) else "∞")
+
+    with col4:
+        st.metric("Nissan Volume", f"{results['nissan_volume']} units")
+        st.metric("Nissan Margin", f"{results['nissan_margin']}%")
+        st.metric("Nissan Annual Profit", f"{results['nissan_profit']:.1f} k€")
+
+    st.subheader("Solar Energy Performance")
+    st.plotly_chart(figures['energy'], use_container_width=True)
+
+    st.subheader("Driving Range Enhancement")
+    st.plotly_chart(figures['range'], use_container_width=True)
+
+    st.subheader("Financial Outlook")
+    st.plotly_chart(figures['payback'], use_container_width=True)
+
+    st.subheader("PV Surface Contribution")
+    if 'contribution' in figures:
+        st.plotly_chart(figures['contribution'], use_container_width=True)
+
+    st.subheader("Battery State of Charge")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Avoided Plug-in Charges", f"{results['avoided_plug_ins']:.0f} / year")
+    with col2:
+        st.metric("Plug-in Charges", f"{results['plug_ins']:.0f} / year")
+    with col3:
+        st.metric("Solar Energy Used", f"{results['solar_used']:.0f} kWh")
+    with col4:
+        st.metric("Curtailed Energy", f"{results['curtailed']:.0f} kWh")
+    st.plotly_chart(figures['soc'], use_container_width=True)
+    st.plotly_chart(figures['capacity'], use_container_width=True)
+
+# Warm result table
+# Default results and chart payloads for every city × segment, rebuilt only when the
+# catalog, irradiation data or defaults change (tracked by a fingerprint).
+WARM_TABLE_PATH = os.environ.get("VIPV_WARM_TABLE", "warm_results.json.gz")
+WARM_TABLE_VERSION = 4
+
+def warm_table_key(region, segment):
+    return f"{region}|{segment}"
+
+def warm_table_fingerprint():
+    """Hash of everything the default results depend on"""
+    inputs = {
+        'version': WARM_TABLE_VERSION,
+        'segments': segments,
+        'irradiation_data': irradiation_data,
+        'energy_cost': energy_cost,
+        'horizon_profiles': {city: profile.tolist() for city, profile in horizon_profiles.items()},
+        'parking_contexts': {name: {k: v.tolist() for k, v in context.items()}
+                             for name, context in parking_contexts.items()},
+        'defaults': default_scenario(cities[0], next(iter(segments))),
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+def load_warm_table(path=WARM_TABLE_PATH):
+    """Read the warm table, or None if it is missing or stale"""
+    try:
+        with gzip.open(path, 'rt') as f:
+            table = json.load(f)
+        if table.get('fingerprint') != warm_table_fingerprint():
+            return None
+        return dict(table['entries'])
+    except (OSError, EOFError, zlib.error, ValueError, KeyError, TypeError, AttributeError):
+        # Unreadable, truncated or malformed tables count as missing
+        return None
+
+def build_warm_table(entries, path=WARM_TABLE_PATH):
+    """Compute default results for every city × segment into entries, then persist them"""
+    for region in cities:
+        for segment in segments:
+            results = calculate_results(default_scenario(region, segment))
+            figures = {name: fig.to_json() for name, fig in build_figures(results).items()}
+            entries[warm_table_key(region, segment)] = {'results': results, 'figures': figures}
+
+    # Write to a private temporary file first so concurrent builders and readers never
+    # see a partial table; os.replace makes the last finished build win atomically
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt') as f:
+            json.dump({'fingerprint': warm_table_fingerprint(), 'entries': entries}, f, separators=(',', ':'))
+        os.chmod(tmp_path, 0o644)  # mkstemp creates owner-only files
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def build_warm_table_in_background(entries):
+    """Thread target for build_warm_table that logs failures instead of dying silently"""
+    try:
+        build_warm_table(entries)
+        logger.info("Warm result table written to %s", WARM_TABLE_PATH)
+    except Exception:
+        logger.exception("Building the warm result table failed; results will be computed on demand")
+
+@st.cache_resource(show_spinner=False)
+def start_warm_up():
+    """Load the warm table once per process
+
+    The table is normally built ahead of time with `python vipv_tool.py --build-warm-table`
+    (run by bin/post_compile at build time). If it is missing or stale it is rebuilt in a
+    background thread as a fallback, which is CPU-heavy while the first sessions are served.
+    """
+    entries = load_warm_table()
+    if entries is None:
+        logger.warning("Warm result table %s is missing or stale; rebuilding it in the background. "
+                       "Run `python vipv_tool.py --build-warm-table` before starting the app to avoid this.",
+                       WARM_TABLE_PATH)
+        entries = {}
+        threading.Thread(target=build_warm_table_in_background, args=(entries,), daemon=True).start()
+    return entries
+
+def lookup_warm_results(entries, scenario):
+    """Precomputed results and figures for a scenario that keeps every default, else None"""
+    if scenario != default_scenario(scenario['region'], scenario['segment']):
+        return None
+    entry = entries.get(warm_table_key(scenario['region'], scenario['segment']))
+    if entry is None:
         return None
+    return entry['results'], {name: pio.from_json(payload) for name, payload in entry['figures'].items()}
+
+# Bulk export of sweep and Monte Carlo results
+# Scenarios are generated and evaluated in fixed-size chunks of arrays; each chunk is
+# streamed to region-partitioned Parquet/Arrow datasets and folded into a small summary,
+# so memory stays bounded by the chunk size regardless of the number of rows.
+EXPORT_DIR = os.environ.get("VIPV_EXPORT_DIR", "exports")
+EXPORT_CHUNK_SIZE = 50_000
+EXPORT_MAX_ROWS_PER_FILE = 5_000_000
+EXPORT_MIN_ROWS_PER_GROUP = 100_000
+EXPORT_MARKER = ".vipv_export"  # Marks directories the exporter may clear
+surface_names = list(dict.fromkeys(name for segment_data in segments.values() for name in segment_data['surfaces']))
+
+# Standard deviations of the Monte Carlo draws around the base assumptions
+monte_carlo_spread = {
+    'pv_efficiency': 2.0,
+    'utilization': 5.0,
+    'cost': 50.0,
+    'transformation_efficiency': 3.0,
+    'price_factor': 0.15
+}
+
+def sweep_tables():
+    """Catalog, irradiation and shading as arrays indexed by city, parking context, segment and surface"""
+    segment_names = list(segments.keys())
+    context_names = list(parking_contexts.keys())
+    shape = (len(segment_names), len(surface_names))
+    area, angle, include = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    for i, segment in enumerate(segment_names):
+        for surface_name, surface_data in segments[segment]['surfaces'].items():
+            j = surface_names.index(surface_name)
+            area[i, j] = surface_data['area']
+            angle[i, j] = surface_data['angle']
+            include[i, j] = surface_data.get('default', True)
+
+    shading = np.array([[shading_factors(city, context, angle.ravel()).reshape(shape + (12,))
+                         for context in context_names] for city in cities])
+    return {
+        'segment_names': segment_names,
+        'context_names': context_names,
+        'irradiation': np.array([irradiation_data[city] for city in cities]),
+        'energy_cost': np.array([energy_cost[city] for city in cities]),
+        'wltp': np.array([segments[segment]['wltp'] for segment in segment_names]),
+        'city': np.array([segments[segment]['city'] for segment in segment_names]),
+        'area': area,
+        'cos_angle': np.cos(np.radians(angle)),
+        'include': include,
+        'side': np.array([2.0 if 'side' in name else 1.0 for name in surface_names]),
+        'shading': shading  # (cities, contexts, segments, surfaces, 12)
+    }
+
+def sweep_batches(regions, segment_names, contexts, samples=1, base=None, chunk_size=EXPORT_CHUNK_SIZE, seed=0):
+    """Yield chunks of scenarios for regions × segments × parking contexts, each with `samples` draws
+
+    With one sample the base assumptions are used as-is (a plain grid sweep); otherwise the
+    continuous inputs are drawn around them using monte_carlo_spread.
+    """
+    base = base or {
+        'pv_efficiency': default_pv_efficiency,
+        'utilization': default_utilization,
+        'cost': default_cost,
+        'transformation_efficiency': default_transformation_efficiency,
+        'price_factor': 1.0
+    }
+    grid = np.array(np.meshgrid([cities.index(r) for r in regions],
+                                [list(segments.keys()).index(s) for s in segment_names],
+                                [list(parking_contexts.keys()).index(c) for c in contexts],
+                                indexing='ij')).reshape(3, -1)
+    total = grid.shape[1] * samples
+
+    for chunk_idx, start in enumerate(range(0, total, chunk_size)):
+        scenario_id = np.arange(start, min(start + chunk_size, total), dtype=np.int64)
+        # Combination-major (region outermost), so each chunk spans as few partitions as possible
+        combo = scenario_id // samples
+        batch = {
+            'scenario_id': scenario_id,
+            'region': grid[0, combo],
+            'segment': grid[1, combo],
+            'parking_context': grid[2, combo]
+        }
+        # Seeded per chunk so any chunk can be regenerated on its own
+        rng = np.random.default_rng([seed, chunk_idx])
+        for name, value in base.items():
+            noise = rng.normal(0, monte_carlo_spread[name], len(scenario_id)) if samples > 1 else 0
+            batch[name] = np.full(len(scenario_id), float(value)) + noise
+        batch['pv_efficiency'] = np.clip(batch['pv_efficiency'], 1, 100)
+        batch['utilization'] = np.clip(batch['utilization'], 1, 100)
+        batch['cost'] = np.clip(batch['cost'], 0, None)
+        batch['transformation_efficiency'] = np.clip(batch['transformation_efficiency'], 1, 100)
+        batch['price_factor'] = np.clip(batch['price_factor'], 0.1, None)
+        yield batch
+
+def evaluate_batch(batch, tables, nissan_margin=default_nissan_margin, nissan_volume=default_nissan_volume):
+    """Scenario-level and monthly-level result columns for a chunk of scenarios"""
+    city, context, segment = batch['region'], batch['parking_context'], batch['segment']
+    side = tables['side']
+
+    # Same model as calculate_results, broadcast over (scenarios, surfaces, months)
+    effective_area = tables['area'][segment] * tables['include'][segment] * (batch['utilization'][:, None] / 100)
+    irradiation = (tables['irradiation'][city][:, None, :] * tables['cos_angle'][segment][..., None] *
+                   tables['shading'][city, context, segment])
+    conversion = (batch['pv_efficiency'] / 100) * (batch['transformation_efficiency'] / 100)
+    energy = effective_area[..., None] * irradiation * conversion[:, None, None] * side[:, None]
+
+    monthly_energy = energy.sum(axis=1)
+    surface_daily_energy = energy.mean(axis=-1)
+    daily_energy = surface_daily_energy.sum(axis=1)
+    annual_energy = monthly_energy.sum(axis=1) * 30.44  # Average days per month
+
+    surface_cost = tables['area'][segment] * tables['include'][segment] * batch['cost'][:, None] * side
+    total_cost = surface_cost.sum(axis=1)
+    annual_savings = annual_energy * tables['energy_cost'][city] * batch['price_factor']
+    payback = np.divide(total_cost, annual_savings, out=np.full_like(total_cost, np.inf), where=annual_savings > 0)
+    surface_profit = surface_cost * (nissan_margin / 100) * nissan_volume / 1000
+
+    wltp = tables['wltp'][segment] / 100
+    city_efficiency = tables['city'][segment] / 100
+    scenarios = {
+        'scenario_id': batch['scenario_id'],
+        'region': city,
+        'segment': segment,
+        'parking_context': context,
+        'pv_efficiency': batch['pv_efficiency'],
+        'utilization': batch['utilization'],
+        'cost_per_m2': batch['cost'],
+        'transformation_efficiency': batch['transformation_efficiency'],
+        'electricity_price': tables['energy_cost'][city] * batch['price_factor'],
+        'daily_energy_kwh': daily_energy,
+        'annual_energy_kwh': annual_energy,
+        'wltp_range_km': daily_energy / wltp,
+        'city_range_km': daily_energy / city_efficiency,
+        'total_cost_eur': total_cost,
+        'annual_savings_eur': annual_savings,
+        'payback_years': payback,
+        'nissan_profit_keur': surface_profit.sum(axis=1)
+    }
+    for j, name in enumerate(surface_names):
+        scenarios[f'{name}_energy_kwh_day'] = surface_daily_energy[:, j]
+        scenarios[f'{name}_profit_keur'] = surface_profit[:, j]
+
+    monthly = {
+        'scenario_id': np.repeat(batch['scenario_id'], 12),
+        'region': np.repeat(city, 12),
+        'month': np.tile(np.arange(1, 13, dtype=np.int8), len(city)),
+        'energy_kwh_day': monthly_energy.ravel(),
+        'wltp_range_km': (monthly_energy / wltp[:, None]).ravel(),
+        'city_range_km': (monthly_energy / city_efficiency[:, None]).ravel()
+    }
+    return scenarios, monthly
+
+def to_arrow(columns, tables):
+    """Arrow table with region, segment and parking context decoded from their indices"""
+    labels = {'region': cities, 'segment': tables['segment_names'], 'parking_context': tables['context_names']}
+    arrays = {}
+    for name, values in columns.items():
+        if name == 'region':
+            # Partition key: plain strings so it can be written as region=<city> directories
+            arrays[name] = pa.array(np.array(cities, dtype=object)[values], type=pa.string())
+        elif name in labels:
+            arrays[name] = pa.DictionaryArray.from_arrays(pa.array(values, type=pa.int32()), pa.array(labels[name]))
+        else:
+            arrays[name] = pa.array(values)
+    return pa.table(arrays)
+
+summary_metrics = ['annual_energy_kwh', 'wltp_range_km', 'total_cost_eur', 'annual_savings_eur',
+                   'payback_years', 'nissan_profit_keur']
+
+def update_summary(summary, scenarios, monthly_energy, tables):
+    """Fold a chunk into running per (region, segment, parking context) count/sum/min/max"""
+    n_groups = len(cities) * len(tables['segment_names']) * len(tables['context_names'])
+    if summary is None:
+        summary = {'count': np.zeros(n_groups), 'monthly_sum': np.zeros((n_groups, 12))}
+        for metric in summary_metrics:
+            summary[f'{metric}_sum'] = np.zeros(n_groups)
+            summary[f'{metric}_min'] = np.full(n_groups, np.inf)
+            summary[f'{metric}_max'] = np.full(n_groups, -np.inf)
+
+    group = ((scenarios['region'] * len(tables['segment_names']) + scenarios['segment']) *
+             len(tables['context_names']) + scenarios['parking_context'])
+    summary['count'] += np.bincount(group, minlength=n_groups)
+    np.add.at(summary['monthly_sum'], group, monthly_energy)
+    for metric in summary_metrics:
+        summary[f'{metric}_sum'] += np.bincount(group, weights=scenarios[metric], minlength=n_groups)
+        np.minimum.at(summary[f'{metric}_min'], group, scenarios[metric])
+        np.maximum.at(summary[f'{metric}_max'], group, scenarios[metric])
+    return summary
+
+def finalize_summary(summary, tables):
+    """Scenario and monthly summary DataFrames from the running aggregates"""
+    n_segments, n_contexts = len(tables['segment_names']), len(tables['context_names'])
+    present = np.nonzero(summary['count'])[0]
+    keys = pd.DataFrame({
+        'Region': np.array(cities)[present // (n_segments * n_contexts)],
+        'Segment': np.array(tables['segment_names'])[present // n_contexts % n_segments],
+        'Parking Context': np.array(tables['context_names'])[present % n_contexts],
+        'Scenarios': summary['count'][present].astype(int)
+    })
+
+    scenario_summary = keys.copy()
+    for metric in summary_metrics:
+        scenario_summary[f'{metric} (mean)'] = summary[f'{metric}_sum'][present] / summary['count'][present]
+        scenario_summary[f'{metric} (min)'] = summary[f'{metric}_min'][present]
+        scenario_summary[f'{metric} (max)'] = summary[f'{metric}_max'][present]
+
+    monthly_means = summary['monthly_sum'][present] / summary['count'][present][:, None]
+    monthly_summary = pd.concat([keys, pd.DataFrame(monthly_means, columns=[f'{m} (kWh/day)' for m in months])], axis=1)
+    return scenario_summary, monthly_summary
+
+class PartitionedWriter:
+    """Region-partitioned Parquet/Arrow IPC dataset writer keeping one open file per partition
+
+    Rows are buffered per partition until min_rows_per_group so row groups stay large,
+    and files roll over after max_rows_per_file rows.
+    """
+
+    def __init__(self, directory, fmt='parquet', max_rows_per_file=EXPORT_MAX_ROWS_PER_FILE,
+                 min_rows_per_group=EXPORT_MIN_ROWS_PER_GROUP):
+        self.directory = directory
+        self.fmt = fmt
+        self.extension = 'parquet' if fmt == 'parquet' else 'arrow'
+        self.max_rows_per_file = max_rows_per_file
+        self.min_rows_per_group = min_rows_per_group
+        self.partitions = {}
+
+    def write(self, table):
+        """Append an Arrow table with a region column to the matching partitions"""
+        regions = table.column('region')
+        data = table.drop_columns(['region'])
+        for region in pc.unique(regions).to_pylist():
+            partition = self.partitions.setdefault(region, {'writer': None, 'file_index': 0, 'file_rows': 0,
+                                                            'buffer': [], 'buffered_rows': 0})
+            rows = data.filter(pc.equal(regions, region))
+            partition['buffer'].append(rows)
+            partition['buffered_rows'] += len(rows)
+            if partition['buffered_rows'] >= self.min_rows_per_group:
+                self._flush(region, partition)
+
+    def close(self):
+        for region, partition in self.partitions.items():
+            self._flush(region, partition)
+            if partition['writer'] is not None:
+                partition['writer'].close()
+
+    def _flush(self, region, partition):
+        if not partition['buffer']:
+            return
+        rows = pa.concat_tables(partition['buffer'])
+        partition['buffer'], partition['buffered_rows'] = [], 0
+        while len(rows):
+            if partition['writer'] is None:
+                path = os.path.join(self.directory, f"region={region}",
+                                    f"part-{partition['file_index']:05d}.{self.extension}")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.fmt == 'parquet':
+                    partition['writer'] = pq.ParquetWriter(path, rows.schema)
+                else:
+                    partition['writer'] = pa.ipc.new_file(path, rows.schema)
+            # Fill the current file up to max_rows_per_file, then roll over
+            part = rows.slice(0, self.max_rows_per_file - partition['file_rows'])
+            rows = rows.slice(len(part))
+            if self.fmt == 'parquet':
+                partition['writer'].write_table(part, row_group_size=len(part))
+            else:
+                partition['writer'].write_table(part)
+            partition['file_rows'] += len(part)
+            if partition['file_rows'] >= self.max_rows_per_file:
+                partition['writer'].close()
+                partition['writer'], partition['file_rows'] = None, 0
+                partition['file_index'] += 1
+
+def prepare_export_dir(directory):
+    """Create an export directory, clearing previous datasets only if the exporter made them"""
+    marker = os.path.join(directory, EXPORT_MARKER)
+    datasets = [os.path.join(directory, name) for name in ('scenarios', 'monthly')]
+    if any(os.path.exists(path) for path in datasets):
+        if not os.path.exists(marker):
+            raise ValueError(f"{directory} already holds scenarios/monthly data that was not written "
+                             f"by this exporter; choose an empty directory")
+        for path in datasets:
+            shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+    open(marker, 'w').close()
+
+def export_sweep(batches, directory=EXPORT_DIR, fmt='parquet', nissan_margin=default_nissan_margin,
+                 nissan_volume=default_nissan_volume, progress=None, total_chunks=None):
+    """Stream scenario and monthly results into region-partitioned datasets under directory
+
+    Writes <directory>/scenarios and <directory>/monthly as Parquet or Arrow IPC files
+    and returns the (scenario, monthly) summary DataFrames.
+    """
+    tables = sweep_tables()
+    prepare_export_dir(directory)
+    writers = {name: PartitionedWriter(os.path.join(directory, name), fmt) for name in ('scenarios', 'monthly')}
+
+    summary = None
+    try:
+        for chunk_idx, batch in enumerate(batches):
+            scenarios, monthly = evaluate_batch(batch, tables, nissan_margin, nissan_volume)
+            writers['scenarios'].write(to_arrow(scenarios, tables))
+            writers['monthly'].write(to_arrow(monthly, tables))
+            summary = update_summary(summary, scenarios, monthly['energy_kwh_day'].reshape(-1, 12), tables)
+            if progress is not None and total_chunks:
+                progress((chunk_idx + 1) / total_chunks)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    if summary is None:
+        return None
+    return finalize_summary(summary, tables)
+
+def summary_report(scenario_summary, monthly_summary, fmt='xlsx'):
+    """Summary report as bytes: an Excel workbook with both sheets, or the scenario summary as CSV"""
+    if fmt == 'csv':
+        return scenario_summary.to_csv(index=False).encode()
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        scenario_summary.to_excel(writer, sheet_name='Summary', index=False)
+        monthly_summary.to_excel(writer, sheet_name='Monthly', index=False)
+    return buffer.getvalue()
+
+# Command line: prebuild the warm table outside the server process
+if __name__ == "__main__" and "--build-warm-table" in sys.argv[1:]:
+    if load_warm_table() is None:
+        build_warm_table({})
+        print(f"Warm result table written to {WARM_TABLE_PATH}")
+    else:
+        print(f"Warm result table {WARM_TABLE_PATH} is up to date")
+    sys.exit(0)
 
 # Streamlit app
 st.set_page_config(layout="wide", page_title="VIPV Evaluation Tool")
@@ -326,12 +1595,13 @@ with tab1:
         # Region selection
         region = st.selectbox("Select Region", cities, index=cities.index('Dubai'))
         
-        # Irradiation source selection
-        irradiation_options = ["Monthly Average", "Solarcast API Forecast"]
-        
-        # Add Tutiempo option only for Spanish cities
-        if region in tutiempo_urls:
-            irradiation_options.append("Tutiempo 15-Day Forecast")
+        # Irradiation source selection: forecasts only where their provider covers the region
+        forecast_sources = {
+            "Solarcast API Forecast": SolarcastProvider,
+            "Tutiempo 15-Day Forecast": TutiempoProvider
+        }
+        irradiation_options = ["Monthly Average"] + [
+            label for label, provider_class in forecast_sources.items() if provider_class.supports(region)]
             
         irradiation_source = st.radio("Irradiation Data Source", 
                                     irradiation_options, 
@@ -341,53 +1611,34 @@ with tab1:
         # Initialize variables
         avg_irradiation = np.mean(irradiation_data[region])
         daily_irradiation = avg_irradiation
+        hourly_irradiation = None
         forecast_data = None
-        forecast_days = None
         selected_day = "Monthly Average"
         data_source = "Monthly Average"
         
-        # Solarcast API integration
+        # Forecast provider selection
+        provider = None
         if irradiation_source == "Solarcast API Forecast":
             api_key = st.text_input("Solarcast API Key", type="password",
                                    help="Get your API key from solarcast.io")
             
-            # Get coordinates for selected region
-            coords = city_coordinates.get(region)
-            if not coords:
-                st.warning(f"Coordinates not available for {region}. Using Dubai coordinates.")
-                coords = city_coordinates['Dubai']
-            
-            # Fetch forecast data
-            if api_key:
-                with st.spinner("Fetching solar forecast..."):
-                    # Try API call with retry
-                    for attempt in range(3):  # Try up to 3 times
-                        forecast_data = get_solarcast_forecast(api_key, coords['lat'], coords['lon'])
-                        if forecast_data is not None:
-                            break
-                        if attempt < 2:  # Not the last attempt
-                            time.sleep(1)  # Wait before retrying
-                
-                if forecast_data:
-                    forecast_days = extract_forecast_days(forecast_data)
-                    if forecast_days:
-                        selected_day = st.selectbox("Select Forecast Day", list(forecast_days.keys()))
-                        daily_irradiation = forecast_days[selected_day]
-                        st.success(f"Using {selected_day} forecast: {daily_irradiation:.2f} kWh/m²/day")
-                        data_source = f"Solarcast API ({selected_day})"
-                    else:
-                        st.warning("Forecast data format not recognized. Using monthly average.")
-                        st.metric("Average Daily Irradiation", f"{avg_irradiation:.2f} kWh/m²/day")
-                else:
-                    st.metric("Average Daily Irradiation", f"{avg_irradiation:.2f} kWh/m²/day")
+            if api_key or FORECAST_MODE in ("replay", "stub"):
+                provider = make_forecast_provider(SolarcastProvider(api_key))
             else:
                 st.info("Please enter your Solarcast API key to get real-time forecasts")
-                st.metric("Average Daily Irradiation", f"{avg_irradiation:.2f} kWh/m²/day")
         
         # Tutiempo integration for Spanish cities
         elif irradiation_source == "Tutiempo 15-Day Forecast":
-            with st.spinner(f"Fetching solar forecast for {region} from Tutiempo.net..."):
-                forecast_data = get_tutiempo_forecast(region)
+            provider = make_forecast_provider(TutiempoProvider())
+        
+        if provider is not None and not provider.supports(region):
+            # e.g. replay mode without a recording for this region
+            st.warning(f"No {provider.name} forecast available for {region}. Using monthly average.")
+            provider = None
+
+        if provider is not None:
+            with st.spinner(f"Fetching solar forecast for {region} from {provider.name}..."):
+                forecast_data = fetch_forecast(provider, region)
                 
             if forecast_data:
                 # Create list of available days with radiation values
@@ -396,9 +1647,10 @@ with tab1:
                 if available_days:
                     selected_day = st.selectbox("Select Forecast Day", available_days)
                     daily_irradiation = forecast_data[selected_day]['radiation']
+                    hourly_irradiation = forecast_data[selected_day].get('hourly')
                     forecast_date = forecast_data[selected_day]['date']
                     st.success(f"Using forecast for {forecast_date}: {daily_irradiation:.2f} kWh/m²/day")
-                    data_source = f"Tutiempo ({forecast_date})"
+                    data_source = f"{provider.name} ({forecast_date})"
                 else:
                     st.warning("No radiation data available in forecast. Using monthly average.")
                     st.metric("Average Daily Irradiation", f"{avg_irradiation:.2f} kWh/m²/day")
@@ -407,6 +1659,10 @@ with tab1:
         else:
             st.metric("Average Daily Irradiation", f"{avg_irradiation:.2f} kWh/m²/day")
             
+        parking_context = st.selectbox("Parking Context", list(parking_contexts.keys()),
+                                       index=list(parking_contexts.keys()).index(default_parking_context),
+                                       help="Buildings and decks around the parked car that occlude the sun")
+
         st.divider()
         st.metric("Default Electricity Price", f"{energy_cost[region]:.2f} €/kWh")
         electricity_price = st.slider("Adjust Electricity Price (€/kWh)",
@@ -428,11 +1684,11 @@ with tab1:
     with col3:
         nissan_margin = st.slider("Nissan Margin (%)",
                                  min_value=0, max_value=50,
-                                 value=20, step=1)
+                                 value=default_nissan_margin, step=1)
     with col4:
         nissan_volume = st.slider("Nissan Volume (units)",
                                  min_value=1, max_value=5000,
-                                 value=500, step=10)
+                                 value=default_nissan_volume, step=10)
 
     st.subheader("PV Surface Configuration")
 
@@ -491,279 +1747,117 @@ with tab1:
                                          min_value=0, max_value=100,
                                          value=default_transformation_efficiency)
 
+    st.subheader("Battery & Driving Profile")
+    col5, col6, col7 = st.columns(3)
+    with col5:
+        battery_capacity = st.slider("Battery Capacity (kWh)",
+                                    min_value=10, max_value=120,
+                                    value=default_battery_capacity, step=1)
+        driving_cycle = st.radio("Consumption Cycle", ["WLTP", "City"], horizontal=True)
+    with col6:
+        target_soc = st.slider("Plug-in Charge Target (%)",
+                              min_value=50, max_value=100,
+                              value=default_target_soc,
+                              help="SOC the driver charges to from the grid")
+        # Kept below the charge target so every plug-in adds energy
+        min_soc = st.slider("Plug-in Threshold (%)",
+                           min_value=0, max_value=min(50, target_soc - 1),
+                           value=default_min_soc,
+                           help="SOC at which the driver plugs in again")
+    with col7:
+        weekday_km = st.number_input("Weekday Distance (km/day)",
+                                    min_value=0, max_value=500,
+                                    value=default_weekday_km)
+        weekend_km = st.number_input("Weekend Distance (km/day)",
+                                    min_value=0, max_value=500,
+                                    value=default_weekend_km)
+
 with tab2:
     st.header("Premium Analysis")
-    
-    if st.button("Calculate Results", type="primary", use_container_width=True):
-        # Determine which irradiation data to use
-        if irradiation_source in ["Solarcast API Forecast", "Tutiempo 15-Day Forecast"] and daily_irradiation:
-            # Use the selected day's irradiation for all months
-            irradiation_to_use = [daily_irradiation] * 12
-        else:
-            # Use the monthly average data
-            irradiation_to_use = irradiation_data[region]
-            data_source = "Monthly Average"
-        
-        # Calculate PV energy production for each surface
-        total_area = 0
-        total_daily_energy = 0
-        total_cost = 0
-        monthly_energy = {month: 0 for month in ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
-                                               'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']}
-        surfaces_results = []
-
-        for surface_name, config in surfaces_config.items():
-            if config.get('include', False):
-                # Calculate for each month
-                monthly_surface_energy = []
-                for month_idx, month in enumerate(monthly_energy.keys()):
-                    # Adjust irradiation by angle (simple cosine correction)
-                    angle_rad = np.radians(config['angle'])
-                    effective_irradiation = irradiation_to_use[month_idx] * np.cos(angle_rad)
-
-                    # Calculate energy for this month
-                    area = config['area'] * (config['utilization']/100)
-                    energy = area * effective_irradiation * (config['efficiency']/100) * (transformation_efficiency/100)
-
-                    # For side windows, multiply by 2 (left and right)
-                    if 'side' in surface_name:
-                        energy *= 2
-
-                    monthly_surface_energy.append(energy)
-                    monthly_energy[month] += energy
-
-                # Calculate average daily energy
-                avg_daily_energy = np.mean(monthly_surface_energy)
-
-                # Calculate cost (not multiplied for side windows - cost is per panel)
-                cost = config['area'] * config['cost']
-                if 'side' in surface_name:
-                    cost *= 2
-
-                surfaces_results.append({
-                    'name': surface_name.replace('_', ' ').title(),
-                    'area': config['area'],
-                    'effective_area': config['area'] * (config['utilization']/100),
-                    'avg_daily_energy': avg_daily_energy,
-                    'monthly_energy': monthly_surface_energy,
-                    'cost': cost
-                })
-
-                total_area += config['area'] * (config['utilization']/100) * (2 if 'side' in surface_name else 1)
-                total_daily_energy += avg_daily_energy
-                total_cost += cost
-
-        # Calculate average efficiency
-        if total_area > 0:
-            avg_efficiency = (total_daily_energy / (total_area * np.mean(irradiation_to_use) * (transformation_efficiency/100))) * 100
-        else:
-            avg_efficiency = 0
-
-        # Calculate ranges
-        wltp_range = (total_daily_energy / (segment_data['wltp'] / 100))  # Convert to km
-        city_range = (total_daily_energy / (segment_data['city'] / 100))
 
-        # Calculate monthly ranges
-        monthly_wltp_range = {month: (energy / (segment_data['wltp'] / 100)) for month, energy in monthly_energy.items()}
-        monthly_city_range = {month: (energy / (segment_data['city'] / 100)) for month, energy in monthly_energy.items()}
+    # Determine which irradiation data to use
+    if irradiation_source in ["Solarcast API Forecast", "Tutiempo 15-Day Forecast"] and daily_irradiation:
+        # Use the selected day's irradiation for all months
+        irradiation_to_use = [daily_irradiation] * 12
+    else:
+        # Use the monthly average data
+        irradiation_to_use = irradiation_data[region]
+        hourly_irradiation = None
+        data_source = "Monthly Average"
 
-        # Calculate annual savings and payback period
-        annual_energy_kwh = sum(monthly_energy.values()) * 30.44  # Average days per month
-        annual_savings = annual_energy_kwh * electricity_price  # Now in EUR
-        payback_period = total_cost / annual_savings if annual_savings > 0 else float('inf')
+    scenario = {
+        'region': region,
+        'segment': segment,
+        'parking_context': parking_context,
+        'irradiation': irradiation_to_use,
+        'hourly_irradiation': hourly_irradiation,
+        'data_source': data_source,
+        'electricity_price': electricity_price,
+        'nissan_margin': nissan_margin,
+        'nissan_volume': nissan_volume,
+        'surfaces_config': surfaces_config,
+        'transformation_efficiency': transformation_efficiency,
+        'battery_capacity': battery_capacity,
+        'target_soc': target_soc,
+        'min_soc': min_soc,
+        'weekday_km': weekday_km,
+        'weekend_km': weekend_km,
+        'driving_cycle': driving_cycle
+    }
 
-        # Calculate Nissan Annual Profit (in k€)
-        nissan_profit = (total_cost * (nissan_margin/100) * nissan_volume) / 1000
+    # Default configurations are served from the warm table without a click
+    warm_results = lookup_warm_results(start_warm_up(), scenario)
 
-        # Display results
-        st.subheader("Feasibility Study Summary")
-        st.info(f"Using irradiation data: **{data_source}**")
+    if st.button("Calculate Results", type="primary", use_container_width=True):
+        results = calculate_results(scenario)
+        render_results(results, build_figures(results))
+    elif warm_results is not None:
+        render_results(*warm_results)
 
-        col1, col2, col3, col4 = st.columns(4)
+    # ---- Bulk Export ----
+    with st.expander("Bulk Export (Sweep / Monte Carlo)"):
+        export_regions = st.multiselect("Regions", cities, default=cities)
+        export_segments = st.multiselect("Segments", list(segments.keys()), default=list(segments.keys()))
+        export_contexts = st.multiselect("Parking Contexts", list(parking_contexts.keys()), default=[parking_context])
+        col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total Area", f"{total_area:.2f} m²")
-            st.metric("Average Efficiency", f"{avg_efficiency:.1f}%")
-            st.metric("Avg. Daily Output", f"{total_daily_energy:.0f} kWh")
-
+            export_samples = st.number_input("Monte Carlo Samples per Combination",
+                                            min_value=1, max_value=1_000_000, value=100,
+                                            help="1 runs a plain grid sweep with the default assumptions")
         with col2:
-            st.metric("Avg. Daily Range (WLTP)", f"{wltp_range:.1f} km")
-            st.metric("Avg. Daily Range (City)", f"{city_range:.1f} km")
-            st.metric("Annual Energy Production", f"{annual_energy_kwh:.0f} kWh")
-
+            export_format = st.radio("Dataset Format", ["Parquet", "Arrow"], horizontal=True)
         with col3:
-            st.metric("Total Investment", f"{total_cost:.0f} €")
-            st.metric("Annual Savings", f"{annual_savings:.0f} €")
-            st.metric("Payback Period", f"{payback_period:.1f} years" if not np.isinf(payback_period) else "∞")
-            
-        with col4:
-            st.metric("Nissan Volume", f"{nissan_volume} units")
-            st.metric("Nissan Margin", f"{nissan_margin}%")
-            st.metric("Nissan Annual Profit", f"{nissan_profit:.1f} k€")
+            report_format = st.radio("Summary Report", ["Excel", "CSV"], horizontal=True)
+        export_dir = st.text_input("Output Directory", value=EXPORT_DIR)
 
-        # ---- Modern Visualization 1: Dual Metric Energy Chart ----
-        st.subheader("Solar Energy Performance")
-        
-        # Convert to DataFrame and adjust units
-        monthly_df = pd.DataFrame({
-            'Month': list(monthly_energy.keys()),
-            'Irradiation (kWh/m²/day)': irradiation_to_use,
-            'Energy Gain (kWh/day)': [e for e in monthly_energy.values()]
-        })
+        n_scenarios = len(export_regions) * len(export_segments) * len(export_contexts) * export_samples
+        st.caption(f"{n_scenarios:,} scenario rows and {n_scenarios * 12:,} monthly rows")
 
-        # Create figure with secondary y-axis
-        fig = px.line(monthly_df, 
-                    x='Month', 
-                    y=['Irradiation (kWh/m²/day)', 'Energy Gain (kWh/day)'],
-                    title=f'<b>Monthly Solar Energy Performance ({data_source})</b>',
-                    labels={'value': 'Energy (kWh)', 'variable': 'Metric'},
-                    color_discrete_sequence=['#FFA15A', '#636EFA'],
-                    template='plotly_white')
-
-        # Formatting updates
-        fig.update_layout(
-            hovermode="x unified",
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(family="Arial", size=12),
-            yaxis=dict(
-                title='Energy (kWh)',
-                tickformat=".1f",
-                range=[0, max(monthly_df['Irradiation (kWh/m²/day)'].max(), 
-                        monthly_df['Energy Gain (kWh/day)'].max()) * 1.1]
-            ),
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
-            )
-        )
+        if st.button("Run Export", disabled=n_scenarios == 0):
+            total_chunks = -(-n_scenarios // EXPORT_CHUNK_SIZE)
+            progress_bar = st.progress(0.0, text="Exporting results...")
+            batches = sweep_batches(export_regions, export_segments, export_contexts, export_samples)
+            try:
+                summaries = export_sweep(
+                    batches, export_dir, export_format.lower(), nissan_margin, nissan_volume,
+                    progress=lambda fraction: progress_bar.progress(fraction, text="Exporting results..."),
+                    total_chunks=total_chunks)
+            except ValueError as e:
+                st.error(str(e))
+                summaries = None
 
-        # Customize hover data
-        fig.update_traces(
-            hovertemplate="<b>%{x}</b><br>" +
-                        "%{yaxis.title.text}: %{y:.1f} kWh<extra></extra>"
-        )
+            if summaries is not None:
+                report_extension = 'xlsx' if report_format == "Excel" else 'csv'
+                report = summary_report(*summaries, report_extension)
+                report_path = os.path.join(export_dir, f"summary.{report_extension}")
+                with open(report_path, 'wb') as f:
+                    f.write(report)
+                st.session_state['export_report'] = (report, os.path.basename(report_path))
+                st.success(f"Wrote {n_scenarios:,} scenarios to {os.path.join(export_dir, 'scenarios')} "
+                           f"and {os.path.join(export_dir, 'monthly')}")
 
-        st.plotly_chart(fig, use_container_width=True)
-        
-        # ---- Modern Visualization 2: Range Gain Bars ----
-        st.subheader("Driving Range Enhancement")
-        range_df = pd.DataFrame({
-            'Month': list(monthly_energy.keys()),
-            'WLTP Range': list(monthly_wltp_range.values()),
-            'City Range': list(monthly_city_range.values())
-        })
-        
-        fig2 = px.bar(range_df, x='Month', y=['WLTP Range', 'City Range'],
-                     barmode='group',
-                     title=f'<b>Additional Daily Driving Range ({data_source})</b>',
-                     labels={'value': 'Kilometers', 'variable': 'Cycle'},
-                     color_discrete_sequence=['#00CC96', '#AB63FA'])
-        
-        # Set y-axis ticks to increment by 5km
-        max_range = max(max(monthly_wltp_range.values()), max(monthly_city_range.values()))
-        fig2.update_layout(
-            hovermode="x unified",
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(family="Arial", size=12),
-            yaxis=dict(
-                tickformat=".1f",
-                tickmode='linear',
-                tick0=0,
-                dtick=5,
-                range=[0, max_range * 1.1]
-            )
-        )
-        st.plotly_chart(fig2, use_container_width=True)
-        
-        # ---- Modern Visualization 3: Financial Outlook ----
-        st.subheader("Financial Outlook")
-        
-        # Create timeline (0 to max_years)
-        max_years = 10
-        years = list(range(0, max_years + 1))
-
-        # Cumulative savings grows each year
-        savings = [annual_savings * year for year in years]
-
-        # Investment remains constant (straight line)
-        investment = [total_cost] * len(years)
-
-        profit_df = pd.DataFrame({
-            'Year': years,
-            'Cumulative Savings (€)': savings,
-            'Investment (€)': investment
-        })
-
-        # Calculate payback year (when savings >= investment)
-        payback_year = next((year for year in years if savings[year] >= investment[year]), None)
-
-        fig3 = px.line(profit_df, x='Year', y=['Cumulative Savings (€)', 'Investment (€)'],
-                      title='<b>Investment Payback Timeline</b>',
-                      color_discrete_sequence=['#19D3F3', '#FF6692'],
-                      markers=True)
-
-        if payback_year is not None:
-            # Add payback point marker
-            payback_value = savings[payback_year]
-            fig3.add_annotation(
-                x=payback_year,
-                y=payback_value,
-                text=f"Payback: {payback_year} years",
-                showarrow=True,
-                arrowhead=1,
-                ax=0,
-                ay=-40
-            )
-            # Add vertical line at payback point
-            fig3.add_vline(x=payback_year, line_dash="dash", 
-                          line_color="gray")
-
-        fig3.update_layout(
-            hovermode="x unified",
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(family="Arial", size=12),
-            yaxis_title="Euros (€)",
-            xaxis=dict(
-                tickmode='linear',
-                tick0=0,
-                dtick=1
-            ),
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
-            )
-        )
-
-        # Customize hover format
-        fig3.update_traces(
-            hovertemplate="<b>Year %{x}</b><br>%{y:,.0f} €<extra></extra>"
-        )
-
-        st.plotly_chart(fig3, use_container_width=True)
-        
-        # ---- Modern Visualization 4: Surface Contribution ----
-        st.subheader("PV Surface Contribution")
-        if surfaces_results:
-            contrib_df = pd.DataFrame({
-                'Surface': [s['name'] for s in surfaces_results],
-                'Contribution (%)': [s['avg_daily_energy']/total_daily_energy*100 for s in surfaces_results],
-                'Area (m²)': [s['effective_area'] for s in surfaces_results]
-            })
-            
-            fig4 = px.sunburst(contrib_df, path=['Surface'], values='Contribution (%)',
-                              color='Area (m²)', color_continuous_scale='Blues',
-                              title=f'<b>Energy Contribution by Surface Area ({data_source})</b>')
-            
-            fig4.update_layout(
-                margin=dict(t=40, l=0, r=0, b=0),
-                font=dict(family="Arial", size=12)
-            )
-            st.plotly_chart(fig4, use_container_width=True)
+        if 'export_report' in st.session_state:
+            report, report_name = st.session_state['export_report']
+            st.download_button("Download Summary Report", data=report, file_name=report_name,
+                               mime='text/csv' if report_name.endswith('.csv') else
+                               'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')